@@ -1,8 +1,14 @@
 import os
+import hashlib
+import secrets
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, render_template, request, redirect, url_for, send_file # Added send_file for export
 import logging
-from zipfile import ZipFile # Added for export functionality
-import io # Added for export functionality
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED # Added for export functionality
+from werkzeug.utils import secure_filename
+from jinja2 import FileSystemBytecodeCache
 
 # --- NEW CUSTOM WSGI MIDDLEWARE ---
 class ReverseProxied:
@@ -16,24 +22,12 @@ class ReverseProxied:
         self.logger = logging.getLogger(__name__)
 
     def __call__(self, environ, start_response):
-        self.logger.info("DEBUG - Inside ReverseProxied middleware: START")
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug("DEBUG - ReverseProxied environ keys: %s", list(environ))
 
-        # --- EXHAUSTIVE ENVIRON LOGGING ---
-        self.logger.info("DEBUG - Dumping relevant environ keys:")
-        # Log ALL keys in environ, not just HTTP_ and specific ones, to be absolutely sure
-        for key, value in environ.items():
-            self.logger.info(f"DEBUG - Environ: {key} = '{value}'")
-        # --- END EXHAUSTIVE ENVIRON LOGGING ---
-
-        # Attempt to get the ingress path from environment
-        # Try common variations for the header name within the WSGI environ
+        # WSGI servers expose the X-Ingress-Path request header as HTTP_X_INGRESS_PATH
         script_name = environ.get('HTTP_X_INGRESS_PATH', '')
-        if not script_name: # Fallback if not found under standard WSGI header name
-            script_name = environ.get('X_INGRESS_PATH', '') # Some servers might pass it without HTTP_ prefix or with underscores
-        if not script_name: # Final fallback for raw header name, though unlikely for WSGI environ
-             script_name = environ.get('X-Ingress-Path', '')
-
-        self.logger.info(f"DEBUG - Middleware detected script_name (attempted from environ): '{script_name}'")
 
         if script_name:
             environ['SCRIPT_NAME'] = script_name
@@ -43,11 +37,11 @@ class ReverseProxied:
                 environ['PATH_INFO'] = path_info[len(script_name):]
             # Flask uses APPLICATION_ROOT internally for url_for
             environ['APPLICATION_ROOT'] = script_name
-            self.logger.info(f"DEBUG - Middleware SET SCRIPT_NAME to: '{environ['SCRIPT_NAME']}'")
-        else:
-            self.logger.warning("DEBUG - Middleware: HTTP_X_INGRESS_PATH (or alternatives) not found or empty in environ.")
+            if debug:
+                self.logger.debug("DEBUG - Middleware SET SCRIPT_NAME to: '%s'", environ['SCRIPT_NAME'])
+        elif debug:
+            self.logger.debug("DEBUG - Middleware: HTTP_X_INGRESS_PATH not found or empty in environ.")
 
-        self.logger.info("DEBUG - Inside ReverseProxied middleware: END")
         return self.app(environ, start_response)
 # --- END NEW CUSTOM WSGI MIDDLEWARE ---
 
@@ -59,97 +53,372 @@ app = Flask(__name__,
             static_folder=os.path.join(BASE_DIR, 'static'),    # Explicit absolute path
             template_folder=os.path.join(BASE_DIR, 'templates')) # Explicit absolute path
 
+# Templates only change with a new image: outside debug mode, never stat them
+# for changes, and share compiled bytecode between workers and restarts.
+if not app.debug:
+    app.config['TEMPLATES_AUTO_RELOAD'] = False
+    app.jinja_env.auto_reload = False
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
 # APPLY THE CUSTOM MIDDLEWARE
 app.wsgi_app = ReverseProxied(app.wsgi_app)
 
 # Configure logging to stdout, which Docker captures.
-logging.basicConfig(level=logging.INFO,
+# WARNING by default; set LOG_LEVEL (e.g. INFO, or DEBUG for the ingress diagnostics) to see more.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING').upper()
+# An unknown level name would make basicConfig raise and stop the add-on booting
+_invalid_log_level = None
+if not isinstance(logging.getLevelName(LOG_LEVEL), int):
+    _invalid_log_level, LOG_LEVEL = LOG_LEVEL, 'WARNING'
+logging.basicConfig(level=LOG_LEVEL,
                     format='%(asctime)s - %(levelname)s - %(message)s',
                     handlers=[logging.StreamHandler()])
-app.logger.setLevel(logging.INFO)
+app.logger.setLevel(LOG_LEVEL)
+if _invalid_log_level:
+    app.logger.warning("Unknown LOG_LEVEL '%s', using WARNING.", _invalid_log_level)
 
-# --- DEBUGGING LOGS (Keep these to see Flask's final state) ---
+# --- DEBUGGING LOGS (Only emitted when the logger is at DEBUG level) ---
 @app.before_request
 def log_request_info_after_middleware():
-    app.logger.info(f"DEBUG - Full Request URL (Flask's view): {request.url}")
-    app.logger.info(f"DEBUG - Request Path (Flask's view): {request.path}")
-    app.logger.info(f"DEBUG - Script Root (Flask's view after middleware): {request.script_root}")
-    app.logger.info(f"DEBUG - Base URL (Flask's view): {request.base_url}")
-    if 'X-Ingress-Path' in request.headers:
-        app.logger.info(f"DEBUG - X-Ingress-Path Header (Flask's view - direct header access): {request.headers['X-Ingress-Path']}")
-    else:
-        app.logger.info("DEBUG - X-Ingress-Path Header (Flask's view - direct header access): NOT FOUND (in request.headers)")
-    # This will log all HTTP_ headers that Flask's request.environ can see AFTER middleware
-    for key, value in request.environ.items():
-        if key.startswith('HTTP_'):
-            app.logger.info(f"DEBUG - request.environ header (Flask's view): {key} = '{value}'")
+    if not app.logger.isEnabledFor(logging.DEBUG):
+        return
+    app.logger.debug("DEBUG - Full Request URL (Flask's view): %s", request.url)
+    app.logger.debug("DEBUG - Request Path (Flask's view): %s", request.path)
+    app.logger.debug("DEBUG - Script Root (Flask's view after middleware): %s", request.script_root)
+    app.logger.debug("DEBUG - Base URL (Flask's view): %s", request.base_url)
+    app.logger.debug("DEBUG - X-Ingress-Path Header (Flask's view - direct header access): %s", request.headers.get('X-Ingress-Path', 'NOT FOUND (in request.headers)'))
 # --- END DEBUGGING LOGS ---
 
 
 # Get notes directory from environment variable set in run.sh.
 NOTES_DIR = os.environ.get('NOTES_DIR', '/config/notes')
 
-@app.before_request # Use @app.before_request for Flask 2.3+ (replaces before_first_request)
+# Largest note that can be stored or loaded into the editor; saves and imports
+# above it are refused with 413. The editor posts a urlencoded form, where every
+# non-ASCII byte, CR and LF is sent as three (%XX), so request bodies are capped
+# at three times that plus room for the field name and multipart headers;
+# Flask answers 413 above it.
+MAX_NOTE_BYTES = 1 << 20
+app.config['MAX_CONTENT_LENGTH'] = 3 * MAX_NOTE_BYTES + 4096
+
 def setup_notes_directory():
-    """Ensures the notes directory exists before each request."""
+    """Ensures the notes directory exists. Called once at startup."""
     try:
         os.makedirs(NOTES_DIR, exist_ok=True)
-        app.logger.info(f"Notes directory ensured at: {NOTES_DIR}")
+        app.logger.info("Notes directory ensured at: %s", NOTES_DIR)
     except OSError as e:
-        app.logger.error(f"Error creating notes directory {NOTES_DIR}: {e}")
+        app.logger.error("Error creating notes directory %s: %s", NOTES_DIR, e)
+
+# Run once at import time rather than per request (before_first_request is gone in Flask 2.3+)
+setup_notes_directory()
+
+# Sorted (filename, path) pairs of the .txt notes, tagged with the NOTES_DIR mtime they were read at
+_dir_cache = (None, [])
+# Titles from the last listing: path -> ((mtime_ns, size), title)
+_note_cache = {}
+# Worker threads used to overlap note reads when several notes miss the cache
+_io_pool = ThreadPoolExecutor(max_workers=8)
+
+# The list view shows at most this many characters of a note's first line
+TITLE_MAX_CHARS = 50
+
+# Changes on every start, so pages cached by browsers are re-rendered after an
+# update even if the notes themselves haven't changed
+_BOOT_ID = secrets.token_hex(4)
+
+# Prebuilt responses (the export zip, the rendered index page) are kept here,
+# named after the version of the notes they were built from. They are rebuilt
+# after every write, so like the worker heartbeats they live on tmpfs rather
+# than the (possibly SD card) disk.
+CACHE_DIR = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'notes_cache')
+# Older versions are only removed once they are this many seconds old, so a
+# request still about to send one doesn't lose it to a concurrent rebuild
+CACHE_STALE_SECONDS = 60
+# Anything else in CACHE_DIR (pages for ingress paths no longer in use, temporary
+# files left by a killed build) is removed once it is this many seconds old
+CACHE_IDLE_SECONDS = 3600
+# Notes at least this large are compressed in the export; smaller ones are stored
+EXPORT_DEFLATE_MIN_BYTES = 4096
+
+# NOTES_DIR with exactly one trailing separator, computed once
+_NOTES_DIR_PREFIX = os.path.join(NOTES_DIR, '')
+
+# Resolved NOTES_DIR, for checking where a note path really points
+_NOTES_DIR_REAL = os.path.realpath(NOTES_DIR)
+
+def _note_path(filename):
+    """Returns the full path of a note in NOTES_DIR."""
+    return _NOTES_DIR_PREFIX + filename
+
+def _safe_note_name(filename):
+    """
+    Returns filename if it names a .txt note directly inside NOTES_DIR, else None.
+    String checks reject traversal and other junk before any filesystem lookup;
+    the realpath check then rejects symlinks that lead out of NOTES_DIR.
+    """
+    if (not filename.endswith('.txt') or filename.startswith('.') or '\0' in filename
+            or filename != os.path.basename(filename)):
+        return None
+    if os.path.dirname(os.path.realpath(_note_path(filename))) != _NOTES_DIR_REAL:
+        return None
+    return filename
+
+# Longest filename base derived from a title or an imported file's name; leaves
+# room for a suffix and .txt well within the usual 255-byte filename limit
+FILENAME_BASE_MAX_CHARS = 100
+
+def _safe_base(title):
+    """Returns a filesystem-safe filename base (without .txt) for a note title."""
+    # Truncate before sanitizing so a huge first line costs nothing, and again
+    # after, as Unicode normalization can expand some characters
+    return secure_filename(title[:FILENAME_BASE_MAX_CHARS])[:FILENAME_BASE_MAX_CHARS] or "untitled_note"
+
+def _list_note_files():
+    """
+    Returns sorted (filename, path) pairs for the .txt files in NOTES_DIR.
+    Directories are skipped; is_file() uses the type from the directory read,
+    so this costs no extra stat.
+    The directory is only re-scanned when its own mtime changes, i.e. when a
+    note is created, deleted or renamed. In-place edits don't touch it, so
+    callers must still stat each file for anything that depends on content.
+    """
+    global _dir_cache
+    mtime_ns = os.stat(NOTES_DIR).st_mtime_ns
+    cached_mtime_ns, files = _dir_cache
+    if cached_mtime_ns != mtime_ns:
+        with os.scandir(NOTES_DIR) as it:
+            files = sorted((entry.name, entry.path) for entry in it if entry.name.endswith(".txt") and entry.is_file())
+        _dir_cache = (mtime_ns, files)
+    return files
+
+def _invalidate_note_cache(path):
+    """
+    Forgets the cached listing, the cached title of the note at path and the
+    prebuilt index pages. Called after every write. The in-memory caches
+    belong to this process only; other workers pick the write up from the
+    changed mtimes and sizes, so on filesystems whose timestamps are too
+    coarse to change between writes a same-size edit can go unnoticed there.
+    """
+    global _dir_cache
+    _dir_cache = (None, [])
+    _note_cache.pop(path, None)
+    try:
+        names = os.listdir(CACHE_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith('index.') and name.endswith('.html'):
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except FileNotFoundError:
+                pass
+
+def _read_title(path):
+    """Returns the first line of a note, truncated for the list view. Only the first 256 bytes are read."""
+    # Unbuffered, so this is exactly one read(2) of 256 bytes and no fstat for a buffer size
+    with open(path, 'rb', buffering=0) as f:
+        head = f.read(256)
+    return head.partition(b'\n')[0].decode('utf-8', 'replace').strip()[:TITLE_MAX_CHARS]
 
 def get_all_notes():
-    """Reads all .txt files from the notes directory and returns them as a list of dictionaries."""
+    """
+    Returns the filename and title of every .txt note in the notes directory.
+    Notes whose mtime and size are unchanged since the last listing are served
+    from _note_cache; the rest are read concurrently on _io_pool.
+    """
+    global _note_cache
     notes = []
-    if os.path.exists(NOTES_DIR):
-        for filename in sorted(os.listdir(NOTES_DIR)):
-            if filename.endswith(".txt"):
-                try:
-                    filepath = os.path.join(NOTES_DIR, filename)
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    # Extract title from the first line for display in index.html
-                    title = content.split('\n')[0].strip() if content else filename.replace('.txt', '')
-                    notes.append({'filename': filename, 'content': content, 'title': title})
-                except Exception as e:
-                    app.logger.error(f"Error reading note {filename}: {e}")
+    try:
+        files = _list_note_files()
+    except OSError as e:
+        app.logger.error("Error listing notes directory %s: %s", NOTES_DIR, e)
+        return notes
+    cache = {}
+    pending = []
+    for filename, path in files:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            app.logger.error("Error reading note %s: %s", filename, e)
+            continue
+        version = (st.st_mtime_ns, st.st_size)
+        cached = _note_cache.get(path)
+        if cached and cached[0] == version:
+            cache[path] = cached
+        else:
+            pending.append((filename, path, version, _io_pool.submit(_read_title, path)))
+    for filename, path, version, future in pending:
+        try:
+            cache[path] = (version, future.result())
+        except Exception as e:
+            app.logger.error("Error reading note %s: %s", filename, e)
+    # Rebuilding the cache from this listing also drops deleted notes
+    _note_cache = cache
+
+    for filename, path in files:
+        if path not in cache:
+            continue
+        # Fall back to the filename when the first line is empty
+        title = cache[path][1] or filename[:-len('.txt')]
+        notes.append({'filename': filename, 'title': title})
     return notes
 
+def _notes_version():
+    """
+    Returns a short hash of the name, mtime and size of every note.
+    Unlike NOTES_DIR's own mtime, it also changes when a note is edited in place.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    for filename, path in _list_note_files():
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        h.update(f"{filename}\0{st.st_mtime_ns}\0{st.st_size}\n".encode('utf-8'))
+    return h.hexdigest()
+
+# Numbered suffixes tried before _create_unique_note_file switches to random ones
+MAX_NUMBERED_SUFFIX = 100
+
+def _create_unique_note_file(filename_base, ext='.txt'):
+    """
+    Exclusively creates a new file in NOTES_DIR and returns (fd, filename).
+    On a name collision it retries with _1, _2, ... and, past
+    MAX_NUMBERED_SUFFIX, with a random suffix. O_EXCL makes the existence
+    check and the create one atomic syscall, so concurrent requests can't
+    claim the same name.
+    """
+    filename = f"{filename_base}{ext}"
+    counter = 0
+    while True:
+        try:
+            fd = os.open(_note_path(filename), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            return fd, filename
+        except FileExistsError:
+            counter += 1
+            suffix = counter if counter <= MAX_NUMBERED_SUFFIX else secrets.token_hex(4)
+            filename = f"{filename_base}_{suffix}{ext}"
+
+def _write_all(fd, data):
+    """Writes all of data to fd with os.write, retrying on short writes."""
+    data = memoryview(data)
+    while data:
+        data = data[os.write(fd, data):]
+
+def _write_note(fd, data):
+    """
+    Writes encoded note data to an open file descriptor and closes it.
+    Uses os.write directly: a note is written in a single syscall instead of
+    going through a buffered text stream.
+    """
+    try:
+        _write_all(fd, data)
+    finally:
+        os.close(fd)
+
+def _cached_file(prefix, version, suffix, write):
+    """
+    Returns the path of CACHE_DIR/<prefix>.<version><suffix>, building it first
+    with write(f) if it doesn't exist. The file is written under a temporary
+    name and renamed into place, so concurrent requests never see (or send) a
+    partial file. Other versions with the same prefix older than
+    CACHE_STALE_SECONDS, and any other file older than CACHE_IDLE_SECONDS, are
+    then removed.
+    """
+    path = os.path.join(CACHE_DIR, f"{prefix}.{version}{suffix}")
+    if os.path.exists(path):
+        return path
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    now = time.time()
+    for name in os.listdir(CACHE_DIR):
+        if name == os.path.basename(path):
+            continue
+        if name.startswith(f"{prefix}.") and name.endswith(suffix):
+            max_age = CACHE_STALE_SECONDS
+        else:
+            max_age = CACHE_IDLE_SECONDS
+        old_path = os.path.join(CACHE_DIR, name)
+        try:
+            if os.stat(old_path).st_mtime < now - max_age:
+                os.remove(old_path)
+        except FileNotFoundError:
+            pass
+    return path
+
+def _send_cached_file(prefix, version, suffix, write, **kwargs):
+    """
+    Sends _cached_file(prefix, version, suffix, write) with send_file(**kwargs).
+    If the file is removed before it can be opened, it is built again.
+    """
+    try:
+        return send_file(_cached_file(prefix, version, suffix, write), **kwargs)
+    except FileNotFoundError:
+        return send_file(_cached_file(prefix, version, suffix, write), **kwargs)
+
 # --- Flask Routes ---
 
 @app.route('/')
 def index():
-    """Renders the main page displaying all notes."""
-    notes = get_all_notes()
-    return render_template('index.html', notes=notes)
+    """
+    Renders the main page displaying all notes.
+    The page is rendered once per version of the notes, ingress path (which
+    ends up in every link) and process start, written to CACHE_DIR and then
+    served from there. That version doubles as the ETag, so a browser
+    revalidating an unchanged page gets a 304. Each ingress path has its own
+    cache prefix, so ingress and direct access don't evict each other's page.
+    """
+    try:
+        prefix = f"index.{hashlib.blake2b(request.script_root.encode('utf-8'), digest_size=4).hexdigest()}"
+        etag = hashlib.blake2b(f"{_notes_version()}\0{request.script_root}\0{_BOOT_ID}".encode('utf-8'),
+                               digest_size=8).hexdigest()
+        response = _send_cached_file(prefix, etag, '.html',
+                                     lambda f: f.write(render_template('index.html', notes=get_all_notes()).encode('utf-8')),
+                                     mimetype='text/html', etag=etag, conditional=True)
+    except OSError as e:
+        app.logger.error("Error preparing index page: %s", e)
+        return render_template('index.html', notes=get_all_notes())
+
+    # This is a page, not a download of the cache file
+    del response.headers['Content-Disposition']
+    # send_file already asks browsers to always revalidate; keep the page out of shared caches
+    response.cache_control.private = True
+    return response
 
 @app.route('/create', methods=['GET', 'POST'])
 def create_note():
     """Handles creating new notes."""
     if request.method == 'POST':
-        # Extract title from the first line of content
-        title = request.form['content'].split('\n')[0].strip()
         content = request.form['content']
+        data = content.encode('utf-8')
+        if len(data) > MAX_NOTE_BYTES:
+            app.logger.warning("Rejected new note of %s bytes.", len(data))
+            return "Note too large", 413
+        # Extract title from the first line of content (partition stops at the
+        # first newline instead of splitting the whole note into a list)
+        title = content.partition('\n')[0].strip()
         
-        # Determine filename, ensure it's not empty and ends with .txt
-        filename_base = title if title.strip() else "untitled_note" 
-        
-        # Ensure filename is unique
+        # Determine filename, ensure it's safe, not empty and ends with .txt
+        filename_base = _safe_base(title)
         filename = f"{filename_base}.txt"
-        counter = 0
-        while os.path.exists(os.path.join(NOTES_DIR, filename)):
-            counter += 1
-            filename = f"{filename_base}_{counter}.txt"
-
-        filepath = os.path.join(NOTES_DIR, filename)
 
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            app.logger.info(f"Note '{filename}' created.")
+            # Claim a unique filename atomically, then write into it
+            fd, filename = _create_unique_note_file(filename_base)
+            filepath = _note_path(filename)
+            _write_note(fd, data)
+            _invalidate_note_cache(filepath)
+            app.logger.debug("Note '%s' created.", filename)
             return redirect(url_for('index'))
         except Exception as e:
-            app.logger.error(f"Error creating note '{filename}': {e}")
+            app.logger.error("Error creating note '%s': %s", filename, e)
             return "Error creating note", 500
     # For GET requests, render the form to create a new note
     # IMPORTANT: Pass an empty 'filename' so 'if note.filename' works for new notes
@@ -158,43 +427,56 @@ def create_note():
 @app.route('/edit/<filename>', methods=['GET', 'POST'])
 def edit_note(filename):
     """Handles editing existing notes."""
-    filepath = os.path.join(NOTES_DIR, filename)
+    if _safe_note_name(filename) is None:
+        app.logger.warning("Rejected edit of invalid note name '%s'.", filename)
+        return "Note not found", 404
+    filepath = _note_path(filename)
     if request.method == 'POST':
-        content = request.form['content']
+        data = request.form['content'].encode('utf-8')
+        if len(data) > MAX_NOTE_BYTES:
+            app.logger.warning("Rejected update of %s bytes to note '%s'.", len(data), filename)
+            return "Note too large", 413
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            app.logger.info(f"Note '{filename}' updated.")
+            _write_note(os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644), data)
+            _invalidate_note_cache(filepath)
+            app.logger.debug("Note '%s' updated.", filename)
             return redirect(url_for('index'))
         except Exception as e:
-            app.logger.error(f"Error updating note '{filename}': {e}")
+            app.logger.error("Error updating note '%s': %s", filename, e)
             return "Error updating note", 500
     else:
         # For GET requests, load the note content for editing
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
+                if os.fstat(f.fileno()).st_size > MAX_NOTE_BYTES:
+                    app.logger.warning("Note '%s' is too large to edit.", filename)
+                    return "Note too large to edit", 413
                 content = f.read()
             # Pass filename explicitly to the template for correct form action
             note = {'filename': filename, 'content': content}
             return render_template('edit_note.html', note=note)
         except FileNotFoundError:
-            app.logger.warning(f"Note '{filename}' not found for editing.")
+            app.logger.warning("Note '%s' not found for editing.", filename)
             return "Note not found", 404
         except Exception as e:
-            app.logger.error(f"Error reading note '{filename}' for editing: {e}")
+            app.logger.error("Error reading note '%s' for editing: %s", filename, e)
             return "Error reading note", 500
 
 @app.route('/delete/<filename>', methods=['POST'])
 def delete_note(filename):
     """Handles deleting notes."""
-    filepath = os.path.join(NOTES_DIR, filename)
+    if _safe_note_name(filename) is None:
+        app.logger.warning("Rejected delete of invalid note name '%s'.", filename)
+        return "Note not found", 404
+    filepath = _note_path(filename)
     try:
         os.remove(filepath)
-        app.logger.info(f"Note '{filename}' deleted.")
+        _invalidate_note_cache(filepath)
+        app.logger.info("Note '%s' deleted.", filename)
     except FileNotFoundError:
-        app.logger.warning(f"Attempted to delete non-existent note '{filename}'.")
+        app.logger.warning("Attempted to delete non-existent note '%s'.", filename)
     except Exception as e:
-        app.logger.error(f"Error deleting note '{filename}': {e}")
+        app.logger.error("Error deleting note '%s': %s", filename, e)
     # Redirect back to the index page after deletion
     return redirect(url_for('index'))
 
@@ -210,44 +492,82 @@ def import_note():
             app.logger.warning("No selected file for import.")
             return "No selected file", 400
         if file:
-            filename = file.filename
-            filepath = os.path.join(NOTES_DIR, filename)
+            # Strip path components and unsafe characters from the client-supplied name
+            filename = secure_filename(file.filename)
+            # Cap the base as _safe_base does, so a long name can't fail with ENAMETOOLONG
+            base, ext = os.path.splitext(filename)
+            filename = base[:FILENAME_BASE_MAX_CHARS] + ext
+            if not filename or _safe_note_name(filename) is None:
+                app.logger.warning("Rejected import with unusable filename '%s'.", file.filename)
+                return "Invalid filename, only .txt notes can be imported", 400
+            created = None
             try:
                 # IMPORTANT: Consider security for imported files. 
                 # Ensure files are .txt or known safe types.
                 # Avoid direct execution or serving arbitrary files.
-                file.save(filepath)
-                app.logger.info(f"File '{filename}' imported successfully.")
+                # Never overwrite an existing note; a colliding name gets a suffix
+                fd, filename = _create_unique_note_file(*os.path.splitext(filename))
+                created = _note_path(filename)
+                # Copy straight from the upload stream into the new file in
+                # 1 MiB chunks, with no buffered file object in between,
+                # stopping as soon as the note passes MAX_NOTE_BYTES.
+                size = 0
+                try:
+                    while size <= MAX_NOTE_BYTES:
+                        chunk = file.stream.read(1 << 20)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        _write_all(fd, chunk)
+                finally:
+                    os.close(fd)
+                if size > MAX_NOTE_BYTES:
+                    os.remove(created)
+                    app.logger.warning("Rejected import of '%s', larger than %s bytes.", filename, MAX_NOTE_BYTES)
+                    return "Note too large", 413
+                _invalidate_note_cache(created)
+                app.logger.debug("File '%s' imported successfully.", filename)
                 return redirect(url_for('index'))
             except Exception as e:
-                app.logger.error(f"Error importing file '{filename}': {e}")
+                app.logger.error("Error importing file '%s': %s", filename, e)
+                # Don't leave a truncated note behind from a failed upload
+                if created:
+                    try:
+                        os.remove(created)
+                    except OSError:
+                        pass
                 return "Error importing file", 500
     # For GET requests (or if POST fails without file), redirect to index
     return redirect(url_for('index'))
 
+def _write_export(f):
+    """Writes a zip of all notes to the binary file f."""
+    # Most notes are tiny, and DEFLATE's per-entry overhead outweighs what it
+    # saves on them, so only larger notes are compressed. Level 3 is about
+    # twice as fast as the default for a few percent of size.
+    with ZipFile(f, 'w', ZIP_STORED) as zipf:
+        for filename, note_path in _list_note_files():
+            try:
+                if os.stat(note_path).st_size >= EXPORT_DEFLATE_MIN_BYTES:
+                    zipf.write(note_path, arcname=filename, compress_type=ZIP_DEFLATED, compresslevel=3)
+                else:
+                    zipf.write(note_path, arcname=filename) # arcname makes it just the filename in the zip
+            except Exception as e:
+                app.logger.error("Error adding %s to zip: %s", filename, e)
+
 @app.route('/export_notes') # <--- THIS IS THE ROUTE THAT WAS MISSING
 def export_notes():
-    """Exports all notes as a zip file."""
+    """
+    Exports all notes as a zip file.
+    The archive is cached on disk per version of the notes, so repeated exports
+    of unchanged notes skip the rebuild and are sent straight from the file
+    (sendfile(2) under Gunicorn, with ETag/Last-Modified and range support).
+    """
     app.logger.info("Export notes functionality requested.")
-    
-    # You'll need to implement the actual zipping and sending logic here.
-    # This is a basic implementation to get it working and avoid the 500 error.
-    # It creates a zip in memory and sends it.
-    
-    data = io.BytesIO()
-    with ZipFile(data, 'w') as zipf:
-        if os.path.exists(NOTES_DIR):
-            for filename in os.listdir(NOTES_DIR):
-                filepath = os.path.join(NOTES_DIR, filename)
-                if os.path.isfile(filepath) and filename.endswith(".txt"): # Only zip .txt files
-                    try:
-                        zipf.write(filepath, arcname=filename) # arcname makes it just the filename in the zip
-                    except Exception as e:
-                        app.logger.error(f"Error adding {filename} to zip: {e}")
-    data.seek(0) # Rewind the in-memory file to the beginning
-    
-    return send_file(data, mimetype='application/zip', as_attachment=True, download_name='all_notes.zip')
-
-
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8099)
+    try:
+        return _send_cached_file('all_notes', _notes_version(), '.zip', _write_export,
+                                 mimetype='application/zip', as_attachment=True,
+                                 download_name='all_notes.zip', conditional=True)
+    except Exception as e:
+        app.logger.error("Error exporting notes: %s", e)
+        return "Error exporting notes", 500
@@ -17,4 +17,9 @@ echo "Notes will be stored in: ${NOTES_DATA_DIR}" # Use echo instead of bashio::
 export NOTES_DIR="${NOTES_DATA_DIR}"
 
 echo "Starting Notes Addon..." # Use echo instead of bashio::log
-exec python3 /app/main.py
+# Gunicorn rather than Flask's development server: threaded workers, and
+# file responses (e.g. the notes export) go out via sendfile(2).
+# Keep-alive lets the browser reuse one connection for the page and its static
+# assets; worker heartbeats go to tmpfs instead of the (possibly SD card) disk.
+# --preload imports the app once in the master so workers share its pages.
+exec gunicorn --chdir /app -k gthread -w 2 --threads 4 --preload --keep-alive 5 --worker-tmp-dir /dev/shm -b 0.0.0.0:8099 main:app